@@ -1,11 +1,13 @@
-from collections import Counter, defaultdict
-import random
+from collections import namedtuple
 
-from deap import tools
+import numpy as np
 
-from .common import teams_from_solution, sorted_teams_from_solution, SolutionScore
+from .common import group_members_from_solution, SolutionScore
 from .iterator import SolverMethod
 
+GeneratedGroups = namedtuple('GeneratedGroups', ['labels', 'members', 'counts', 'valid',
+                                                 'penalties', 'availability', 'num_members'])
+
 
 def evaluate_permutation(solution, solver):
     """Calculate the fitness score of a solution.
@@ -15,61 +17,251 @@ def evaluate_permutation(solution, solver):
         solver: the SchedulingSolver instance
         split_score: whether to split the score (for debugging purposes)
     """
+    clustering_weight, scheduling_weight = solver.current_step.parameters['weights']
+    groups = generated_groups(solution, solver, penalties=bool(clustering_weight),
+                              availability=bool(scheduling_weight))
+    score = assignment_score(groups, solver)
+
+    # Evaluate schedules.
+    if scheduling_weight:
+        evaluate_schedule(solution, score, solver, groups.availability, groups.num_members)
+    return score,
+
 
-    # create score object
+def evaluate_population(population, solver):
+    """Calculate the fitness scores of a population, scoring all schedules at once.
+
+    Args:
+        population: the solutions to calculate fitness scores for
+        solver: the SchedulingSolver instance
+
+    Returns:
+        list with a tuple of one SolutionScore object per solution, like evaluate_permutation
+    """
     clustering_weight, scheduling_weight = solver.current_step.parameters['weights']
-    score = SolutionScore(clustering_weight, scheduling_weight)
-    trait_weight_sum = sum(solver.trait_weights)
+    groups = [generated_groups(solution, solver, penalties=bool(clustering_weight),
+                               availability=bool(scheduling_weight))
+              for solution in population]
+    scores = [assignment_score(solution_groups, solver) for solution_groups in groups]
 
-    # Create temporary SchedulingGroup objects for measurements.
-    generated_groups = teams_from_solution(solution, solver.assignable_individuals)
+    if scores and scheduling_weight:
 
-    for group in generated_groups:
+        # Pad the availability tables to the same number of groups. Padded groups have no members.
+        num_groups = max(len(solution_groups.num_members) for solution_groups in groups)
+        num_options = len(solver.option_days)
+        availability = np.zeros((len(groups), num_groups, num_options), dtype=np.int16)
+        num_members = np.zeros((len(groups), num_groups), dtype=np.int16)
+        for p, solution_groups in enumerate(groups):
+            availability[p, :len(solution_groups.num_members)] = solution_groups.availability
+            num_members[p, :len(solution_groups.num_members)] = solution_groups.num_members
 
-        # Score of 0 if group is too small.
-        if len(group.members) < solver.min_members_per_group:
-            continue
+        results = score_schedules(
+            np.array([solution[-1] for solution in population]), availability, num_members,
+            solver.slot_groups, solver.option_days, solver.courses_per_team, solver.min_available)
 
-        score.assignment['score'] += 1.0
+        for score, schedule_score, not_enough, same_day in zip(scores, *results):
+            score.scheduling['score'] += schedule_score
+            score.scheduling['penalty']['Not enough members'] += not_enough
+            score.scheduling['penalty']['Same day schedule'] += same_day
 
-        # The penalty is the weighted sum of mean trait differences
-        if clustering_weight and solver.num_traits:
-            penalties = [solver.trait_weights[t] *
-                         group.trait_cumulative_penalty(t, 0.0, normalize=True)
-                         for t in range(solver.num_traits)]
+    return [(score,) for score in scores]
 
-            # Store penalties in SolutionScore object.
-            for t, penalty in enumerate(penalties):
-                trait_key = 'Trait {} differences'.format(t+1)
-                score.assignment['penalty'][trait_key] += penalty / trait_weight_sum
 
-    assignable = solver.assignable_groups + generated_groups
+def assignment_score(groups, solver):
+    """Create a SolutionScore object with the assignment score of a solution.
 
-    # Evaluate schedules.
-    if scheduling_weight:
-        evaluate_schedule(solution, score, solver, assignable)
-    return score,
+    Args:
+        groups: the GeneratedGroups of the solution
+        solver: the SchedulingSolver instance
+
+    Returns:
+        SolutionScore object
+    """
+    clustering_weight, scheduling_weight = solver.current_step.parameters['weights']
+    score = SolutionScore(clustering_weight, scheduling_weight, solver.trait_penalty_keys)
 
+    # Score of 0 for groups that are too small.
+    valid = groups.valid
+    score.assignment['score'] += float(np.count_nonzero(valid))
 
-def evaluate_schedule(solution, score, solver, assignable):
-    for g in range(solver.courses_per_team * len(assignable)):
-        option = solution[-1][g]
-        group = assignable[g // solver.courses_per_team]
+    # The penalty is the weighted sum of mean trait differences
+    if clustering_weight and solver.num_traits and valid.any():
 
-        # Ensure enough members are available.
-        if group.availability(option) >= solver.min_available:
-            score.scheduling['score'] += float(group.availability(option)) / group.num_members
+        # Store penalties in SolutionScore object.
+        for trait_key, penalty in zip(solver.trait_penalty_keys,
+                                      groups.penalties * solver.normalized_trait_weights):
+            score.assignment['penalty'][trait_key] += penalty
+
+    return score
+
+
+def generated_groups(solution, solver, penalties=True, availability=True):
+    """Measure the groups generated by a solution.
+
+    The measurements only depend on the group assignment, so they are stored on the solution and
+    reused until a mutation of the assignment resets solution.groups to None. The trait penalties
+    and availability table are only calculated once they are requested.
+
+    Args:
+        solution: the solution to measure the generated groups of
+        solver: the SchedulingSolver instance
+        penalties: whether to calculate the trait penalties
+        availability: whether to calculate the availability table
+
+    Returns:
+        GeneratedGroups tuple of the group labels, members and counts as returned by
+        group_members_from_solution, a boolean array of groups with enough members, the summed
+        trait penalties of those groups, and the availability table and sizes of all groups
+    """
+    groups = getattr(solution, 'groups', None)
+    if groups is None:
+        labels, members, counts = group_members_from_solution(solution,
+                                                              solver.assignable_individuals)
+        valid = counts >= solver.min_members_per_group
+        groups = GeneratedGroups(labels, members, counts, valid, None, None, None)
+
+    if penalties and groups.penalties is None:
+        trait_penalty = np.zeros(solver.num_traits)
+        if solver.num_traits and groups.valid.any():
+            trait_penalty = trait_penalties(solver.trait_matrix[groups.members],
+                                            groups.counts)[groups.valid].sum(axis=0)
+        groups = groups._replace(penalties=trait_penalty)
+
+    if availability and groups.availability is None:
+        table, num_members = availability_table(solver, groups.members, groups.counts)
+        groups = groups._replace(availability=table, num_members=num_members)
+
+    if hasattr(solution, 'groups'):
+        solution.groups = groups
+    return groups
+
+
+def trait_penalties(traits, counts):
+    """Calculate the mean absolute deviation of each trait within each group.
+
+    Args:
+        traits: (members x traits) array of normalized traits, sorted by group
+        counts: the number of members per group
+
+    Returns:
+        (groups x traits) array of penalties
+    """
+    starts = np.cumsum(counts) - counts
+    means = np.add.reduceat(traits, starts) / counts[:, np.newaxis]
+    deviations = np.abs(traits - np.repeat(means, counts, axis=0))
+    return np.add.reduceat(deviations, starts) / counts[:, np.newaxis]
+
+
+def score_schedule(schedule, availability, num_members, slot_groups, option_days,
+                   courses_per_team, min_available):
+    """Score a group schedule using precomputed availability.
+
+    Args:
+        schedule: array of assigned options, with courses_per_team consecutive options per group
+        availability: (groups x options) array with the number of available members
+        num_members: array with the number of members per group
+        slot_groups: array with the group of each position in the schedule
+        option_days: array with the day of each option
+        courses_per_team: number of courses per group
+        min_available: minimum number of available members per course
+
+    Returns:
+        tuple of (score, number of courses without enough members, same day penalty)
+    """
+    results = score_schedules(schedule[np.newaxis], availability[np.newaxis],
+                              num_members[np.newaxis], slot_groups, option_days,
+                              courses_per_team, min_available)
+    return tuple(float(result[0]) for result in results)
+
+
+def score_schedules(schedules, availability, num_members, slot_groups, option_days,
+                    courses_per_team, min_available):
+    """Score the group schedules of a population using precomputed availability.
+
+    Args:
+        schedules: (solutions x slots) array of assigned options, see score_schedule
+        availability: (solutions x groups x options) array with the number of available members
+        num_members: (solutions x groups) array with the number of members per group, where
+            groups without members are ignored
+        slot_groups: array with the group of each position in the schedule
+        option_days: array with the day of each option
+        courses_per_team: number of courses per group
+        min_available: minimum number of available members per course
+
+    Returns:
+        tuple of arrays with the score, the number of courses without enough members and the
+        same day penalty of each solution
+    """
+    num_solutions, num_groups = num_members.shape
+    options = schedules[:, :courses_per_team * num_groups]
+    groups = slot_groups[:options.shape[1]]
+
+    # Ensure enough members are available.
+    available = availability[np.arange(num_solutions)[:, np.newaxis], groups, options]
+    sizes = num_members[:, groups]
+    assigned = sizes > 0
+    enough = (available >= min_available) & assigned
+    score = np.where(enough, available / np.maximum(sizes, 1), 0.0).sum(axis=1)
+    not_enough = (np.count_nonzero(assigned, axis=1) -
+                  np.count_nonzero(enough, axis=1)).astype(float)
+
+    # Give penalties for one group being twice assigned to the same day. With one bit per day,
+    # the days of a group are distinct exactly when the sum of their bits equals the bitwise or.
+    # With a single day, every group with more than one course has a duplicate day.
+    if option_days[-1] == 0:
+        duplicates = np.full((num_solutions, num_groups), courses_per_team > 1)
+    else:
+        days = option_days[options].reshape(num_solutions, num_groups, courses_per_team)
+        if option_days[-1] < 63:
+            bits = np.left_shift(1, days, dtype=np.int64)
+            duplicates = np.bitwise_or.reduce(bits, axis=2) != bits.sum(axis=2)
         else:
-            score.scheduling['penalty']['Not enough members'] += 1.0
+            duplicates = (np.diff(np.sort(days, axis=2), axis=2) == 0).any(axis=2)
+    same_day = 2.0 * np.count_nonzero(duplicates & (num_members > 0), axis=1)
+
+    return score, not_enough, same_day
+
+
+def availability_table(solver, members, counts):
+    """Calculate the availability and size of all groups in a solution.
+
+    Generated groups follow the fixed groups, in order of appearance in the solution.
 
-    # Give penalties for one group being twice assigned to the same day.
-    for g in range(len(assignable)):
-        assignments = [solver.timeslot_offset_to_pair(solution[-1][g * solver.courses_per_team + i])[0]
-                       for i in range(solver.courses_per_team)]
+    Args:
+        solver: the SchedulingSolver instance
+        members: the generated group members, see group_members_from_solution
+        counts: the number of members per generated group
+
+    Returns:
+        tuple of the (groups x options) availability table and the number of members per group
+    """
+    if not len(counts):
+        return solver.group_availability, solver.group_sizes
+
+    # Sum the preferences of the members of each group with a single reduction.
+    generated_availability = np.add.reduceat(solver.individual_preferences[members],
+                                             np.cumsum(counts) - counts)
+    return (np.concatenate([solver.group_availability, generated_availability]),
+            np.concatenate([solver.group_sizes, counts]))
+
+
+def evaluate_schedule(solution, score, solver, availability, num_members):
+    """Add the scheduling score of a solution to a SolutionScore object.
 
-        count = Counter(assignments)
-        if count.most_common(1)[0][1] > 1:
-            score.scheduling['penalty']['Same day schedule'] += 2.0
+    Args:
+        solution: the solution to calculate the scheduling score for
+        score: the SolutionScore object to update
+        solver: the SchedulingSolver instance
+        availability: (groups x options) availability table, see availability_table
+        num_members: the number of members per group
+    """
+    schedule_score, not_enough, same_day = score_schedule(
+        np.asarray(solution[-1]), availability, num_members, solver.slot_groups,
+        solver.option_days, solver.courses_per_team, solver.min_available)
+
+    score.scheduling['score'] += schedule_score
+    score.scheduling['penalty']['Not enough members'] += not_enough
+    score.scheduling['penalty']['Same day schedule'] += same_day
 
 
 def generate_permutation(solver):
@@ -88,42 +280,86 @@ def generate_permutation(solver):
         num_groups = solver.get_number_of_groups_by_number_of_individuals(
             len(individuals_group))
 
-        options = []
         if solver.num_traits:
             # Create groups sorted by the first trait
             average_group_size = len(individuals_group) / num_groups
             if False and solver.num_traits == 2:
-                order = sorted([(individual.normalized_traits[0] + individual.normalized_traits[1], i)
-                                for i, individual in enumerate(individuals_group)])
+                keys = [individual.normalized_traits[0] + individual.normalized_traits[1]
+                        for individual in individuals_group]
             else:
-                order = sorted([(individual.traits[0], i)
-                                for i, individual in enumerate(individuals_group)])
-            options = [-1] * len(individuals_group)
-
-            for i, (_, individual_id) in enumerate(order):
-                group = groups_offset + int(i // average_group_size)
-                options[individual_id] = group
-
-            count = Counter(options)
-            for key, value in count.items():
-                options += [key] * (solver.max_members_per_group - value)
+                keys = [individual.traits[0] for individual in individuals_group]
+
+            # A stable sort keeps individuals with equal traits in order.
+            order = np.argsort(keys, kind='stable')
+            options = np.empty(len(individuals_group), dtype=int)
+            options[order] = groups_offset + (np.arange(len(order)) //
+                                              average_group_size).astype(int)
+
+            # Pad each group up to the maximum group size.
+            counts = np.bincount(options, minlength=groups_offset + num_groups)
+            padding = np.where(counts, np.maximum(solver.max_members_per_group - counts, 0), 0)
+            options = np.concatenate([options, np.repeat(np.arange(len(counts)), padding)])
         else:
-            for i in range(groups_offset, num_groups + groups_offset):
-                options.extend([i] * solver.max_members_per_group)
-            random.shuffle(options)
+            options = np.repeat(np.arange(groups_offset, groups_offset + num_groups),
+                                solver.max_members_per_group)
+            solver.random_state.shuffle(options)
 
         groups_offset += num_groups
         permutation.append(options)
 
     # Create a final list of group schedules.
-    options = []
-    for k in range(sum(solver.timeslots)):
-        options.extend([k] * solver.num_boats)
-    random.shuffle(options)
+    options = np.repeat(np.arange(solver.num_options), solver.num_boats)
+    solver.random_state.shuffle(options)
     permutation.append(options)
 
     return permutation
 
+def clone_permutation(individual):
+    """Copy a solution, its fitness and its cached group measurements.
+
+    The parts of a solution are flat integer arrays, so copying each part is enough. The cached
+    GeneratedGroups are never modified, so the copy shares them with the original. The solution
+    and fitness are created without their deap initializers, which are costly for every clone,
+    and the weighted fitness values are copied directly.
+
+    Args:
+        individual: the solution to copy
+
+    Returns:
+        the copied solution
+    """
+    clone = type(individual).__new__(type(individual))
+    clone.extend([part.copy() for part in individual])
+
+    fitness_class = type(individual.fitness)
+    clone.fitness = fitness_class.__new__(fitness_class)
+    clone.fitness.wvalues = individual.fitness.wvalues
+    clone.groups = individual.groups
+    return clone
+
+
+def vary_population(population, toolbox, mutpb, random_state=np.random):
+    """Create offspring by mutating individuals of a population, like deap's varAnd without mating.
+
+    Only the individuals that are mutated are cloned. The others are passed on as they are, so
+    the offspring may hold the same individual more than once; it is cloned before it changes.
+
+    Args:
+        population: the individuals to vary
+        toolbox: the deap toolbox with clone and mutate functions
+        mutpb: probability for each individual to be mutated
+        random_state: numpy RandomState to draw from, the global one by default
+
+    Returns:
+        list of offspring
+    """
+    offspring = list(population)
+    for i in np.flatnonzero(random_state.random_sample(len(offspring)) < mutpb).tolist():
+        offspring[i], = toolbox.mutate(toolbox.clone(offspring[i]))
+        del offspring[i].fitness.values
+    return offspring
+
+
 def mutate_permutation(individual, solver):
     method, parameters = solver.current_step.method, solver.current_step.parameters
     # print("Before: {}".format(individual))
@@ -131,15 +367,59 @@ def mutate_permutation(individual, solver):
     if method in (SolverMethod.CLUSTERING, SolverMethod.BOTH):
         # mutate_assignment(individual, solver, parameters['inpdb'])
         for item in individual[:-1]:
-            tools.mutShuffleIndexes(item, parameters['inpdb'])
+            shuffle_indexes(item, parameters['inpdb'], solver.random_state)
+        individual.groups = None
 
     if method in (SolverMethod.SCHEDULING, SolverMethod.BOTH):
-        tools.mutShuffleIndexes(individual[-1], parameters['inpdb'])
+        shuffle_indexes(individual[-1], parameters['inpdb'], solver.random_state)
 
     # print("After: {}".format(individual))
     return individual,
 
 
+def select_tournament(individuals, k, tournsize, random_state=np.random):
+    """Select k individuals with tournaments, like deap's selTournament.
+
+    All tournaments are drawn at once and decided on an array of the weighted fitness values.
+
+    Args:
+        individuals: the individuals to select from
+        k: the number of individuals to select
+        tournsize: the number of individuals in each tournament
+        random_state: numpy RandomState to draw from, the global one by default
+
+    Returns:
+        list of the selected individuals
+    """
+    fitness = np.array([individual.fitness.wvalues[0] for individual in individuals])
+    aspirants = random_state.randint(0, len(individuals), (k, tournsize))
+    winners = aspirants[np.arange(k), fitness[aspirants].argmax(axis=1)]
+    return [individuals[i] for i in winners.tolist()]
+
+
+def shuffle_indexes(sequence, probability, random_state=np.random):
+    """Shuffle a sequence in place like deap's mutShuffleIndexes.
+
+    All random numbers are drawn at once, so only the positions that are swapped are visited.
+
+    Args:
+        sequence: the array to shuffle
+        probability: probability for each position to be swapped with another position
+        random_state: numpy RandomState to draw from, the global one by default
+    """
+    size = len(sequence)
+    if size < 2:
+        return sequence,
+
+    positions = np.flatnonzero(random_state.random_sample(size) < probability)
+    targets = random_state.randint(0, size - 1, len(positions))
+    targets[targets >= positions] += 1
+
+    for i, j in zip(positions.tolist(), targets.tolist()):
+        sequence[i], sequence[j] = sequence[j], sequence[i]
+    return sequence,
+
+
 def mutate_assignment(individual, solver, probability):
     """Adjusted version of mutShuffleIndexes.
 
@@ -151,71 +431,119 @@ def mutate_assignment(individual, solver, probability):
         solver: the SolutionSolver instance
         probability: base probability for exchange
     """
-    generated_groups = sorted_teams_from_solution(individual, solver.assignable_individuals)
-    num_groups_per_collection = [
-        solver.get_number_of_groups_by_number_of_individuals(len(collection))
-        for collection in individual[:-1]
-    ]
-
-    def group_offset(c, g):
-        return sum(num_groups_per_collection[:c]) + g
+    # Average traits of each generated group, indexed by group number.
+    groups = generated_groups(individual, solver, penalties=False, availability=False)
+    labels, members, counts = groups.labels, groups.members, groups.counts
+    trait_averages = np.zeros((solver.total_groups, solver.num_traits))
+    if len(labels):
+        trait_averages[labels] = (np.add.reduceat(solver.trait_matrix[members],
+                                                  np.cumsum(counts) - counts) /
+                                  counts[:, np.newaxis])
+
+    # Offset of each collection in the trait matrix.
+    offsets = np.cumsum([0] + [len(collection) for collection in solver.assignable_individuals])
 
     multiplier = 1.0
     for c, collection in enumerate(individual[:-1]):
 
         size = len(collection)
-        for i in range(size):
-            drawn = random.random()
-            if drawn > probability * multiplier:
-                continue
+        num_individuals = offsets[c + 1] - offsets[c]
+        if size < 2:
+            continue
 
-            swap_indx = random.randint(0, size - 2)
-            if swap_indx >= i:
-                swap_indx += 1
+        # Draw all random numbers at once and only visit the positions that may be swapped.
+        drawn = solver.random_state.random_sample(size)
+        positions = np.flatnonzero(drawn <= probability * multiplier)
+        targets = solver.random_state.randint(0, size - 1, len(positions))
+        targets[targets >= positions] += 1
 
+        for i, swap_indx in zip(positions.tolist(), targets.tolist()):
             swap_group = collection[swap_indx]
 
-            print(solver.num_traits, solver.assignable_individuals[c][i].normalized_traits)
-            print(group_offset(c, swap_group))
-            print(len(generated_groups))
-            difference = sum([abs(solver.assignable_individuals[c][i].normalized_traits[x] -
-                              generated_groups[group_offset(c, swap_group)].trait_average(x))
-                          for x in range(solver.num_traits)])
+            difference = 0.0
+            if i < num_individuals:
+                difference = np.abs(solver.trait_matrix[offsets[c] + i] -
+                                    trait_averages[swap_group]).sum()
 
-            chance = probability * (1.0 / max(1.0, difference)) 
-            if drawn < chance:
+            chance = probability * (1.0 / max(1.0, difference))
+            if drawn[i] < chance:
                 collection[i], collection[swap_indx] = collection[swap_indx], collection[i]
 
+    individual.groups = None
     return individual,
 
 
 def finalize_solution(solution, solver):
+    """Improve the schedule of a solution by swapping courses until no swap improves it.
 
-    generated_groups = teams_from_solution(solution, solver.assignable_individuals)
-    assignable = solver.assignable_groups + generated_groups
+    Instead of scoring the full schedule for every candidate swap, only the change in score of
+    the two swapped courses and the same day penalty of their groups is calculated.
 
-    while True:
-        score = SolutionScore()
-        evaluate_schedule(solution, score, solver, assignable)
-        schedule = solution[-1]
+    Args:
+        solution: the solution to improve
+        solver: the SchedulingSolver instance
+    """
+    availability, num_members = generated_groups(solution, solver, penalties=False)[-2:]
+    num_slots = solver.courses_per_team * len(num_members)
+
+    schedule = np.array(solution[-1])
+    groups = solver.slot_groups[:num_slots]
+    days = solver.option_days
+
+    # Number of courses per group per day, used to track same day penalties.
+    day_counts = np.zeros((len(num_members), days[-1] + 1), dtype=int)
+    np.add.at(day_counts, (groups, days[schedule[:num_slots]]), 1)
+
+    def course_score(group, option):
+        available = availability[group, option]
+        return np.where(available >= solver.min_available, available / num_members[group], -1.0)
+
+    def same_day_change(group, removed_day, added_day):
+        """Change in same day penalty when moving a course of a group to another day."""
+        excess = np.maximum(day_counts[group] - 1, 0).sum(axis=-1)
+        new_excess = (excess - (day_counts[group, removed_day] >= 2) +
+                      (day_counts[group, added_day] >= 1))
+        return 2.0 * ((new_excess > 0).astype(float) - (excess > 0))
+
+    # Candidates for swapping with slot i are the slots after it, taken as views of this array.
+    slots = np.arange(len(schedule))
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(num_slots):
+            candidates = slots[i + 1:]
+            if not len(candidates):
+                continue
 
-        continue_loop = False
-        for i in range(solver.courses_per_team * len(assignable)):
-            for j in range(i+1, len(schedule)):
-                new_schedule = list(schedule)
-                new_schedule[i] = schedule[j]
-                new_schedule[j] = schedule[i]
+            option, other_options = schedule[i], schedule[candidates]
+            group, day, other_days = groups[i], days[schedule[i]], days[other_options]
+            assigned = candidates < num_slots
+            other_groups = groups[np.minimum(candidates, num_slots - 1)]
 
-                new_score = SolutionScore()
-                evaluate_schedule(solution[:-1] + [new_schedule], new_score, solver, assignable)
-                if new_score.scheduling_score() > score.scheduling_score():
-                    solution = solution[:-1] + [new_schedule]
-                    continue_loop = True
+            # Change in score of the two swapped courses.
+            delta = course_score(group, other_options) - course_score(group, option)
+            delta[assigned] += (course_score(other_groups[assigned], option) -
+                                course_score(other_groups[assigned], other_options[assigned]))
+
+            # Change in same day penalty; swapping within a group changes nothing.
+            moved = (other_days != day) & ~(assigned & (other_groups == group))
+            delta[moved] -= same_day_change(group, day, other_days[moved])
+            moved &= assigned
+            delta[moved] -= same_day_change(other_groups[moved], other_days[moved], day)
+
+            best = int(np.argmax(delta))
+            if delta[best] <= 1e-9:
+                continue
 
-            if continue_loop:
-                break
+            j = candidates[best]
+            day_counts[group, day] -= 1
+            day_counts[group, other_days[best]] += 1
+            if j < num_slots:
+                day_counts[groups[j], other_days[best]] -= 1
+                day_counts[groups[j], day] += 1
 
-        if not continue_loop:
-            break
+            schedule[i], schedule[j] = schedule[j], schedule[i]
+            improved = True
 
-    return solution
\ No newline at end of file
+    return solution[:-1] + [schedule]
@@ -1,20 +1,35 @@
 import argparse
-from collections import defaultdict
+import copy
+from itertools import chain
+import os
+
+import numpy as np
+import yaml
 from .entities import SchedulingGroup
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# Parsed config files, by path, modification time and size.
+_configs = {}
+
 
 class SolutionScore(object):
 
-    def __init__(self, assignment_weight=1.0, scheduling_weight=1.0):
+    scheduling_penalties = ('Not enough members', 'Same day schedule')
+
+    def __init__(self, assignment_weight=1.0, scheduling_weight=1.0, assignment_penalties=()):
 
         self.assignment = {
             'score': 0.0,
-            'penalty': defaultdict(float),
+            'penalty': dict.fromkeys(assignment_penalties, 0.0),
             'weight': assignment_weight
         }
         self.scheduling = {
             'score': 0.0,
-            'penalty': defaultdict(float),
+            'penalty': dict.fromkeys(self.scheduling_penalties, 0.0),
             'weight': scheduling_weight
         }
 
@@ -42,10 +57,11 @@ class SolutionScore(object):
             print('{} score:'.format(key))
             print('  - Score: {:.3f}'.format(score))
             print('  - Maximum score: {:.3f}'.format(maximum))
-            if scores['penalty']:
+            penalties = {name: penalty for name, penalty in scores['penalty'].items() if penalty}
+            if penalties:
                 print('  - Original score: {:.3f}'.format(scores['score']))
                 print('  - Penalties:')
-                for name, penalty in scores['penalty'].items():
+                for name, penalty in penalties.items():
                     print('      - {}: -{:.3f}'.format(name, penalty))
 
     def __gt__(self, other):
@@ -54,9 +70,50 @@ class SolutionScore(object):
                 else self.score() > other)
 
 
+def group_members_from_solution(solution, assignable_individuals):
+    """Find the members of the groups generated by a solution.
+
+    Individuals are numbered consecutively over all collections of assignable individuals.
+
+    Args:
+        solution: the solution permutation
+        assignable_individuals: the individuals to assign to temporary groups
+
+    Returns:
+        labels: array with the number of each group, in order of first appearance
+        members: array of individual indices, sorted by group
+        counts: array with the number of members of each group
+    """
+    if not assignable_individuals:
+        return np.array([], dtype=int), np.array([], dtype=int), np.array([], dtype=int)
+
+    # A part may be shorter than its collection, in which case the remaining individuals are not
+    # assigned. Each assigned individual keeps its index in all collections together.
+    lengths = [min(len(solution[i]), len(category))
+               for i, category in enumerate(assignable_individuals)]
+    offsets = np.cumsum([0] + [len(category) for category in assignable_individuals[:-1]])
+    assignments = np.concatenate([np.asarray(solution[i][:length], dtype=int)
+                                  for i, length in enumerate(lengths)])
+    positions = np.concatenate([offset + np.arange(length, dtype=int)
+                                for offset, length in zip(offsets.tolist(), lengths)])
+    labels, first, inverse = np.unique(assignments, return_index=True, return_inverse=True)
+
+    # Rank the groups by first appearance and sort the individuals by group rank.
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    groups = rank[inverse]
+
+    members = positions[np.argsort(groups, kind='stable')]
+    counts = np.bincount(groups, minlength=len(labels))
+    return labels[order], members, counts
+
+
 def teams_from_solution(solution, assignable_individuals, group_prefix='Generated group'):
     """Generate teams from the individuals that were scheduled.
 
+    Individuals beyond the end of the part of their collection are not part of any team.
+
     Args:
         solution: the solution permutation
         assignable_individuals: the individuals to assign to temporary groups
@@ -64,18 +121,14 @@ def teams_from_solution(solution, assignable_individuals, group_prefix='Generate
     Returns:
         list of SchedulingGroup instances
     """
-    generated_teams = defaultdict(list)
+    labels, members, counts = group_members_from_solution(solution, assignable_individuals)
+    individuals = list(chain.from_iterable(assignable_individuals))
 
-    # Add all individuals to a group list, then create the group based on its members
-    for i, category in enumerate(assignable_individuals):
-        part = solution[i]
-        for individual, group in enumerate(part):
-            if individual >= len(category):
-                break
-            generated_teams[group].append(category[individual])
-
-    return [SchedulingGroup('{} {}'.format(group_prefix, g+1), members)
-            for g, members in generated_teams.items()]
+    # Members are sorted by group, so each group is a contiguous slice.
+    members = [individuals[i] for i in members.tolist()]
+    ends = np.cumsum(counts).tolist()
+    return [SchedulingGroup('{} {}'.format(group_prefix, g+1), members[end - count:end])
+            for g, count, end in zip(labels.tolist(), counts.tolist(), ends)]
 
 
 def sorted_teams_from_solution(solution, assignable_individuals, group_prefix='Generated group'):
@@ -94,6 +147,25 @@ def sorted_teams_from_solution(solution, assignable_individuals, group_prefix='G
     )
 
 
+def load_config(filename):
+    """Load a .yaml config file, using libyaml if it is available.
+
+    Parsed files are cached until they are modified.
+
+    Args:
+        filename: path to the config file
+
+    Returns:
+        the parsed config
+    """
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+    if key not in _configs:
+        with open(filename) as infile:
+            _configs[key] = yaml.load(infile, Loader=SafeLoader)
+    return copy.deepcopy(_configs[key])
+
+
 def parse_args(data=None):
     """Define the command line arguments to be passed."""
     parser = argparse.ArgumentParser()
@@ -113,6 +185,7 @@ def parse_args(data=None):
                              'or more input files are supplied.',
                         choices=['individuals', 'groups'])
     group.add_argument('-g', '--num_to_generate', help='number of individuals/groups to generate', type=int)
+    group.add_argument('--seed', help='seed for the random number generators, for reproducible runs', type=int)
 
     group.add_argument('--num_traits', help='number of traits in input csv files')
     group.add_argument('-w', '--trait_weights', nargs='*', help='trait weights')
@@ -128,6 +201,8 @@ def parse_args(data=None):
     group.add_argument('-l', '--availability_likelihood', help='likelihood of a member being available for an option', type=float)
     group.add_argument('-x', '--generations', help='number of generations to test', type=int)
     group.add_argument('-y', '--population', help='population size per generation', type=int)
+    group.add_argument('-j', '--processes', help='number of processes to evaluate fitness with, 0 for all cores', type=int)
+    group.add_argument('--islands', help='number of separately evolving subpopulations', type=int)
     if data:
         args = parser.parse_args(data)
     else:
@@ -1,4 +1,3 @@
-import random
 from itertools import count
 import numpy as np
 
@@ -8,10 +7,13 @@ class SchedulingIndividual(object):
 
     Args:
         name: identifier of individual
-        preferences: list of booleans which represent the availability per timeslot
+        preferences: int8 array of zeros and ones which represent the availability per timeslot
         traits: list of quantitative traits, such as length, which are used for making groups
     """
 
+    __slots__ = ('id', 'name', 'preferences', 'traits', 'traits_label', 'info',
+                 'normalized_traits', 'scheduled_timeslots_availability', 'group')
+
     _ids = count(0)
 
     num_members = 1
@@ -21,6 +23,7 @@ class SchedulingIndividual(object):
         self.name = name
         self.preferences = preferences
         self.traits = traits if traits is not None else []
+        self.traits_label = ', '.join(map(str, self.traits))
         self.info = info if info is not None else []
         self.normalized_traits = []
         self.scheduled_timeslots_availability = []
@@ -32,17 +35,17 @@ class SchedulingIndividual(object):
             averages: list of averages
             stdevs: list of standard deviations
         """
-        for i, (average, stdev) in enumerate(zip(averages, stdevs)):
-            self.normalized_traits.append((self.traits[i] - average) / stdev)
+        self.normalized_traits = (np.asarray(self.traits, dtype=float) - averages) / stdevs
 
-    def randomize_preferences(self, num_options, likelihood):
+    def randomize_preferences(self, num_options, likelihood, random_state=np.random):
         """Randomize whether an individual is available at an option or not.
 
         Args:
             num_options: number of options to evaluate
             likelihood: likelihood of individual being available
+            random_state: numpy RandomState to draw from, the global one by default
         """
-        self.preferences = [int(random.random() < likelihood) for _ in range(num_options)]
+        self.preferences = (random_state.random_sample(num_options) < likelihood).astype(np.int8)
 
     def availability(self, option=None):
         """Return availability at a certain option, or all options if no option is supplied.
@@ -68,6 +71,9 @@ class SchedulingGroup(object):
         num_options: the number of timeslots available
     """
 
+    __slots__ = ('id', 'group_id', 'name', 'members', 'num_options', 'num_members',
+                 'scheduled_timeslots', '_preference_matrix', '_trait_matrix', '_trait_means')
+
     _ids = count(0)
 
     def __init__(self, name, members, num_options=None):
@@ -76,14 +82,15 @@ class SchedulingGroup(object):
         self.group_id = int(parts[-1]) if parts[-1].isnumeric() else self.id
         self.name = name
         self.members = members
-        self.averages = {}
+        self._trait_matrix = None
+        self._trait_means = None
         for member in members:
             member.group = self
 
         # If num_options is not supplied, infer from preferences.
         if num_options:
             self.num_options = num_options
-        elif members[0].preferences:
+        elif members[0].preferences is not None:
             self.num_options = len(members[0].preferences)
         else:
             print('Cannot infer number of options (SchedulingGroup)')
@@ -91,13 +98,26 @@ class SchedulingGroup(object):
 
         self.num_members = len(self.members)
         self.scheduled_timeslots = []
+        self._preference_matrix = None
+
+    def trait_matrix(self):
+        """Return a (members x traits) array with the normalized traits of all members."""
+        if self._trait_matrix is None:
+            self._trait_matrix = np.array([member.normalized_traits for member in self.members],
+                                          dtype=float).reshape(len(self.members), -1)
+            self._trait_means = self._trait_matrix.mean(axis=0)
+        return self._trait_matrix
+
+    def invalidate_traits(self):
+        """Rebuild the trait matrix on next use, after member traits or membership have changed."""
+        self._trait_matrix = None
+        self._trait_means = None
 
     def trait_average(self, trait):
         """Calculate the average value of a trait in a group."""
-        if trait not in self.averages:
-            self.averages[trait] = np.mean([member.normalized_traits[trait]
-                                            for member in self.members])
-        return self.averages[trait]
+        if self._trait_means is None:
+            self.trait_matrix()
+        return self._trait_means[trait]
 
     def trait_cumulative_penalty(self, trait, margin=0.0, normalize=False):
         """Calculate the cumulative penalty of a trait in a group.
@@ -110,26 +130,40 @@ class SchedulingGroup(object):
         if not self.members:
             return 0.0
 
-        values = [member.normalized_traits[trait] for member in self.members]
-        average = np.mean(values)
-        return (sum([max(0, abs(value - average) - margin) for value in values])
+        values = self.trait_matrix()[:, trait]
+        return (np.maximum(np.abs(values - self._trait_means[trait]) - margin, 0.0).sum()
                 / (len(self.members) if normalize else 1.0))
 
-    def randomize_preferences(self, likelihood):
+    def randomize_preferences(self, likelihood, random_state=np.random):
         """Randomize the availability of all members
 
         Args:
         1    likelihood: likelihood of a member being available
+            random_state: numpy RandomState to draw from, the global one by default
         """
-        for member in self.members:
-            member.randomize_preferences(self.num_options, likelihood)
+        matrix = (random_state.random_sample((self.num_members, self.num_options)) < likelihood)
+        self._preference_matrix = matrix.astype(np.int8)
+
+        # The preferences of each member are a row of the matrix.
+        for member, preferences in zip(self.members, self._preference_matrix):
+            member.preferences = preferences
+
+    def invalidate_preferences(self):
+        """Rebuild the preference matrix on next use, after member preferences have changed."""
+        self._preference_matrix = None
+
+    def preference_matrix(self):
+        """Return a (members x options) array with the preferences of all members."""
+        if self._preference_matrix is None:
+            self._preference_matrix = np.array([member.preferences for member in self.members],
+                                               dtype=np.int8).reshape(-1, self.num_options)
+        return self._preference_matrix
 
     def availability(self, option=None):
         """Return availability at a certain option, or all options if no option is supplied."""
         if option is not None:
-            return sum([member.preferences[option] for member in self.members])
-        return [sum([member.preferences[option] for member in self.members])
-                for option in range(self.num_options)]
+            return int(self.preference_matrix()[:, option].sum())
+        return self.preference_matrix().sum(axis=0).tolist()
 
     def add_scheduled_timeslot(self, timeslot):
         self.scheduled_timeslots.append(timeslot)
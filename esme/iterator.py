@@ -1,8 +1,7 @@
 import time
 from enum import Enum
 import csv
-
-import progressbar
+from operator import methodcaller
 
 
 class SolverMethod(Enum):
@@ -35,6 +34,8 @@ class SolverStep(object):
         kwargs: named parameters to pass
     """
 
+    __slots__ = ('method', 'i', 'parameters')
+
     def __init__(self, i_, method, **kwargs):
         self.method = method
         self.i = i_
@@ -58,6 +59,9 @@ class SolverPhase(object):
         kwargs: named parameters to pass
     """
 
+    __slots__ = ('method', 'iterations', 'maxtime', 'parameters', '_generate_step',
+                 'starting_time', 'deadline', 'step', 'global_offset')
+
     def __init__(self, method, iterations=None, maxtime=None, **kwargs):
         # if iterations is None and maxtime is None:
             # raise ValueError("Either iterations or maxtime needs to be defined.")
@@ -70,7 +74,14 @@ class SolverPhase(object):
         self.maxtime = maxtime
         self.parameters = kwargs
 
+        # The method is fixed for a phase, so select how steps are generated once. The function
+        # is stored unbound, as a bound method would make the phase refer to itself.
+        self._generate_step = (type(self)._generate_alternating_step
+                               if method == SolverMethod.ALTERNATING
+                               else type(self)._generate_static_step)
+
         self.starting_time = None
+        self.deadline = None
         self.step = 0
         self.global_offset = 0
 
@@ -88,25 +99,35 @@ class SolverPhase(object):
     def progression_type(self):
         return 'time' if self.maxtime is not None else 'generations'
 
-    def _generate_step(self):
-        """Generate a SolverStep item for this phase.
+    def _generate_static_step(self):
+        """Generate a SolverStep item for a phase with a single method.
 
         Returns:
             SolverStep
         """
-        if self.method == SolverMethod.ALTERNATING:
-            return SolverStep(
-                self.global_offset + self.step,
-                SolverMethod.SCHEDULING if (self.step % 2) else SolverMethod.CLUSTERING,
-                **self.parameters
-            )
         return SolverStep(self.global_offset + self.step, self.method, **self.parameters)
 
+    def _generate_alternating_step(self):
+        """Generate a SolverStep item for a phase alternating between clustering and scheduling.
+
+        Returns:
+            SolverStep
+        """
+        return SolverStep(
+            self.global_offset + self.step,
+            SolverMethod.SCHEDULING if (self.step % 2) else SolverMethod.CLUSTERING,
+            **self.parameters
+        )
+
+    def time_exceeded(self):
+        """Returns whether the maximum time of this phase has passed."""
+        return self.deadline is not None and time.monotonic() > self.deadline
+
     def stop_iteration(self):
         """Returns whether to end this phase."""
         return (
             (self.iterations is not None and self.step >= self.iterations) or
-            (self.maxtime is not None and time.time() - self.starting_time > self.maxtime)
+            self.time_exceeded()
         )
 
     def __iter__(self):
@@ -115,18 +136,23 @@ class SolverPhase(object):
 
     def __next__(self):
         if self.starting_time is None:
-            self.starting_time = time.time()
+            self.starting_time = time.monotonic()
+            if self.maxtime is not None:
+                self.deadline = self.starting_time + self.maxtime
 
         if self.stop_iteration():
             raise StopIteration
 
-        result = self._generate_step()
+        result = self._generate_step(self)
         self.step += 1
         return result
 
 
 class SolverProgressionPhase(SolverPhase):
 
+    __slots__ = ('max_iterations_without_progress', 'last_step_with_progress',
+                 'last_fitness_value')
+
     def __init__(self, method, max_iterations_without_progress, **parameters):
         self.max_iterations_without_progress = max_iterations_without_progress
         self.last_step_with_progress = 0
@@ -148,7 +174,7 @@ class SolverProgressionPhase(SolverPhase):
         """Returns whether to end this phase."""
         return (
             (self.step - self.last_step_with_progress >= self.max_iterations_without_progress) or
-            (self.maxtime is not None and time.time() - self.starting_time > self.maxtime)
+            self.time_exceeded()
         )
 
 
@@ -161,6 +187,8 @@ class SolverIterator(object):
 
     _progressbar = None
     _widgets = None
+    _last_update = float('-inf')
+    update_interval = 0.25
     current_phase = 0
     phases = None
     score_history = None
@@ -168,7 +196,7 @@ class SolverIterator(object):
 
     def __init__(self, phases):
 
-        if not all([isinstance(phase, SolverPhase) for phase in phases]):
+        if not all(isinstance(phase, SolverPhase) for phase in phases):
             raise ValueError("Phase must be instance of class SolverPhase")
 
         self.phases = phases
@@ -201,6 +229,9 @@ class SolverIterator(object):
     def widgets(self):
         """Return a list of widgets"""
         if not self._widgets:
+            # Only import progressbar once a progress bar is shown.
+            import progressbar
+
             phases_digits = len(str(len(self.phases)))
             phase_widget = progressbar.DynamicMessage('phase', width=1 + 2 * phases_digits)
             score_widget = progressbar.DynamicMessage('score', width=4)
@@ -215,15 +246,24 @@ class SolverIterator(object):
     def initialize_progressbar(self):
         """Build and return a progress bar."""
         if not self._progressbar:
+            import progressbar
             self._progressbar = progressbar.ProgressBar(max_value=100.0, widgets=self.widgets())
         return self._progressbar
 
     def update_progressbar(self, score, final=False):
         """Update the values shown in the progress bar.
 
+        Updates are limited to one per update interval, except for the final update.
+
         Args:
             score: current solution score
+            final: whether this is the last update
         """
+        now = time.monotonic()
+        if not final and now - self._last_update < self.update_interval:
+            return
+
+        self._last_update = now
         self._progressbar.update(self.percentual_progress(),
                                  score=score,
                                  phase=self.phase_progress())
@@ -248,13 +288,13 @@ class SolverIterator(object):
         Args:
             savefile: csv to write to
         """
-        assignment, scheduling = zip(*[(score.assignment_score(), score.scheduling_score())
-                                       for score in self.score_history])
+        assignment = map(methodcaller('assignment_score'), self.score_history)
+        scheduling = map(methodcaller('scheduling_score'), self.score_history)
         with open(savefile, 'w') as outfile:
             writer = csv.writer(outfile)
             writer.writerow(['i', 'assignment', 'scheduling', 'total'])
-            for i in range(len(assignment)):
-                writer.writerow([i, assignment[i], scheduling[i], assignment[i] + scheduling[i]])
+            writer.writerows([i, a, s, a + s]
+                             for i, (a, s) in enumerate(zip(assignment, scheduling)))
 
     def set_progress_callback(self, handler):
         """Set up a handler for reporting intermediate progress."""
@@ -1,6 +1,7 @@
 import os
 import csv
 from collections import defaultdict
+from itertools import chain
 import numpy as np
 from .entities import SchedulingIndividual, SchedulingGroup
 
@@ -36,8 +37,12 @@ class InputFileParser(object):
         if len(row) != valid_row_length:
             raise ValueError("Row does not have valid number of columns: {}".format(str(row)))
 
-        if any([int(availability) not in [0, 1] for availability in self._extract_availability(row)]):
-            raise ValueError("Incorrect value in availability: {}".format(self._extract_availability(row)))
+    def _validate_availability(self, rows, availability):
+        """Make sure all availability values are either 0 or 1."""
+        invalid = np.flatnonzero(((availability != 0) & (availability != 1)).any(axis=1))
+        if len(invalid):
+            raise ValueError("Incorrect value in availability: {}".format(
+                self._extract_availability(rows[invalid[0]])))
 
     def _extract_traits(self, row):
         return row[2 + self.num_info:2 + self.num_info + self.num_traits]
@@ -55,29 +60,39 @@ class InputFileParser(object):
 
             # Skip header
             next(reader)
-
-            # Read all individuals from file
-            for row in reader:
-                self._validate_row(row)
-                name = row[0]
-                group = row[1]
-                info = self._extract_info(row)
-                availability = [int(x) for x in self._extract_availability(row)]
-                traits = [float(x) for x in self._extract_traits(row)]
-
-                self.groups[group].append(SchedulingIndividual(name, availability, info=info, traits=traits))
+            rows = list(reader)
+
+        for row in rows:
+            self._validate_row(row)
+        if not rows:
+            return
+
+        # Convert the availability and traits of all rows at once.
+        availability = np.array([self._extract_availability(row) for row in rows]).astype(int)
+        self._validate_availability(rows, availability)
+        traits = np.array([self._extract_traits(row) for row in rows]).astype(float)
+
+        # Read all individuals from file. Their preferences are rows of a single int8 array.
+        for row, preferences, individual_traits in zip(rows, availability.astype(np.int8),
+                                                       traits.tolist()):
+            name = row[0]
+            group = row[1]
+            info = self._extract_info(row)
+            self.groups[group].append(SchedulingIndividual(name, preferences, info=info,
+                                                           traits=individual_traits))
 
     def _normalize_traits(self):
         """Each trait may have a different distribution. Normalize the traits."""
-        averages, stdevs = [], []
-        individuals = [individual for group in self.groups for individual in self.groups[group]]
-        for trait in range(self.num_traits):
-            trait_values = [individual.traits[trait] for individual in individuals]
-            averages.append(np.mean(trait_values))
-            stdevs.append(np.std(trait_values))
+        individuals = list(chain.from_iterable(self.groups.values()))
+        if not individuals:
+            return
 
-        for individual in individuals:
-            individual.normalize_traits(averages, stdevs)
+        traits = np.fromiter(chain.from_iterable(individual.traits for individual in individuals),
+                             dtype=float, count=len(individuals) * self.num_traits)
+        traits = traits.reshape(len(individuals), self.num_traits)
+        normalized = (traits - traits.mean(axis=0)) / traits.std(axis=0)
+        for individual, normalized_traits in zip(individuals, normalized):
+            individual.normalized_traits = normalized_traits
 
     def _generate_lists(self):
         """Generate two lists from input data and return them.
@@ -144,16 +159,22 @@ class GroupScheduleParser(object):
         return [self.lookup[group] for group in groups]
 
     def _enrich_groups(self):
+        # Collect the preference indices at which each group is scheduled.
+        scheduled = defaultdict(list)
         index = 0
         for day, timeslots in enumerate(self.schedule):
             for timeslot, groups in enumerate(timeslots):
                 for group in groups:
                     group.add_scheduled_timeslot((day, timeslot))
-                    for individual in group.members:
-                        individual.scheduled_timeslots_availability.append(
-                            individual.preferences[index])
+                    scheduled[group].append(index)
                 index += 1
 
+        # Gather the availability of all members at those indices at once.
+        for group, indices in scheduled.items():
+            availability = group.preference_matrix()[:, indices].tolist()
+            for individual, available in zip(group.members, availability):
+                individual.scheduled_timeslots_availability.extend(available)
+
     def _validate_groups(self):
         frequency = [len(group.scheduled_timeslots) for group in self.groups]
         if min(frequency) < max(frequency):
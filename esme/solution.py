@@ -1,9 +1,8 @@
 import os
-import yaml
 from collections import namedtuple
+from itertools import chain
 
-from .common import SolutionScore
-from .algorithms import evaluate_schedule
+from .common import SolutionScore, load_config
 from .parsers import InputFileParser, GroupScheduleParser
 
 
@@ -34,15 +33,21 @@ class Solution(object):
     def _validate_name(self):
         """Ensure all required files exist."""
         extensions = ['groups', 'schedule', 'progress']
-
-        for extension in extensions:
-            filename = self._resolve_input(extension)
-            if not os.path.isfile(filename):
+        filenames = [self._resolve_input(extension) for extension in extensions]
+        filenames.append(self._resolve_config())
+
+        # List the directory once instead of checking each file separately.
+        directory = os.path.dirname(self.solution_name) or os.curdir
+        try:
+            with os.scandir(directory) as entries:
+                existing = {entry.name for entry in entries if entry.is_file()}
+        except OSError:
+            existing = set()
+
+        for filename in filenames:
+            if os.path.basename(filename) not in existing:
                 raise ValueError('File `{}` does not exist.'.format(filename))
 
-        if not os.path.isfile(self._resolve_config()):
-            raise ValueError('File `{}` does not exist.'.format(filename))
-
     def _load_config(self):
         """Load configuration file"""
         parameters = [
@@ -60,8 +65,7 @@ class Solution(object):
         ]
 
         # Parse config file. These override default values.
-        with open(self._resolve_config()) as infile:
-            self.config = yaml.safe_load(infile)
+        self.config = load_config(self._resolve_config())
 
         for key in self.config:
             if key not in parameters:
@@ -85,12 +89,18 @@ class Solution(object):
         pass
 
     def _calculate_score(self):
+        # Every scheduled course of a team counts the availability of its members over all of the
+        # team's scheduled courses.
         score, maximum = 0, 0
-        for day in self.schedule:
-            for timeslot in day:
-                for team in timeslot:
-                    for individual in team.members:
-                        score += sum(individual.scheduled_timeslots_availability)
-                        maximum += len(individual.scheduled_timeslots_availability)
+        for team in self.groups:
+            if not team.scheduled_timeslots:
+                continue
+
+            # Availability values are 0 or 1, so counting the ones gives the sum.
+            availability = list(chain.from_iterable(individual.scheduled_timeslots_availability
+                                                    for individual in team.members))
+            courses = len(team.scheduled_timeslots)
+            score += courses * availability.count(1)
+            maximum += courses * len(availability)
 
         self.score = round(100.0 * score / maximum, 1)
\ No newline at end of file
@@ -1,21 +1,54 @@
-import random
-from collections import Counter
+from collections import OrderedDict
 import csv
+from functools import partial
 import itertools
+import multiprocessing
 import yaml
 
 from tabulate import tabulate
 import numpy as np
-from deap import creator, base, tools, algorithms
+from deap import creator, base, tools
 
-from .common import sorted_teams_from_solution
-from .algorithms import evaluate_permutation, mutate_permutation, generate_permutation, \
-    finalize_solution
+from .common import load_config, sorted_teams_from_solution
+from .algorithms import evaluate_permutation, evaluate_population, mutate_permutation, \
+    generate_permutation, finalize_solution, clone_permutation, select_tournament, vary_population
 from .entities import SchedulingGroup, SchedulingIndividual
 from .parsers import InputFileParser
 from .profiles import parse_profile
 
 
+# The deap classes are created once, so solving again or in worker processes does not replace
+# them. An individual is a permutation of numbers. Measurements of the groups it generates are
+# cached in its groups attribute.
+if not hasattr(creator, 'FitnessMax'):
+    creator.create('FitnessMax', base.Fitness, weights=(1.0,))
+if not hasattr(creator, 'Individual'):
+    creator.create('Individual', list, fitness=creator.FitnessMax, groups=None)
+
+
+# Solver of a worker process, set once when the worker starts.
+_worker_solver = None
+
+
+def _initialize_worker(solver):
+    """Store the solver in a worker process, so it is not sent along with every task."""
+    global _worker_solver
+    _worker_solver = solver
+
+
+def _evaluate_chunk(task):
+    """Score a chunk of solutions in a worker process.
+
+    Args:
+        task: tuple of the current SolverStep and the solutions to score
+
+    Returns:
+        list with a tuple of one SolutionScore object per solution
+    """
+    _worker_solver.current_step, solutions = task
+    return evaluate_population(solutions, _worker_solver)
+
+
 class SchedulingSolver():
     """ Main class for the scheduling problem solver."""
     generate = None
@@ -35,8 +68,15 @@ class SchedulingSolver():
     min_available = None
     generations = None
     population = None
+    processes = None
+    seed = None
+    random_state = None
+    islands = None
+    migration_interval = None
+    migrants = None
     indpb = None
     timeslots = None
+    num_options = None
     generated_group_prefix = None
 
     solution = None
@@ -47,12 +87,28 @@ class SchedulingSolver():
     profile = None
 
     current_step = None
+    option_days = None
+    option_slots = None
+    timeslot_names = None
+    slot_groups = None
+    group_availability = None
+    group_sizes = None
+    individual_preferences = None
+    trait_matrix = None
+    normalized_trait_weights = None
+    trait_penalty_keys = None
+    fitness_cache = None
 
     def __init__(self, args):
         if not args:
             return
 
         self.load_scheduling_parameters(args)
+
+        # All randomness, from generating groups to selecting and varying solutions, is drawn
+        # from the random state of this solver.
+        self.random_state = np.random.RandomState(self.seed)
+
         self.solution_iterator = parse_profile(self.profile)
         self.parse_timeslots()
 
@@ -78,9 +134,11 @@ class SchedulingSolver():
             number_of_groups = self.get_number_of_groups_by_number_of_individuals(len(group))
             self.total_groups += number_of_groups
 
-        total_options_available = self.num_boats * sum(self.timeslots)
+        total_options_available = self.num_boats * self.num_options
         total_to_assign = self.total_groups * self.courses_per_team
 
+        self._initialize_lookup_tables()
+
         if self.verbose:
             self._report_initialization()
 
@@ -89,6 +147,43 @@ class SchedulingSolver():
             print("Please calibrate your parameters and try again.")
             exit()
 
+    def _initialize_lookup_tables(self):
+        """Store the data needed to evaluate solutions in contiguous arrays."""
+        num_options = self.num_options
+        individuals = list(itertools.chain.from_iterable(self.assignable_individuals))
+
+        # Lookup tables used when evaluating schedules.
+        self.slot_groups = np.repeat(np.arange(self.total_groups), self.courses_per_team)
+        self.group_availability = np.array(
+            [group.availability() for group in self.assignable_groups], dtype=np.int16
+        ).reshape(len(self.assignable_groups), num_options)
+        self.group_sizes = np.array([group.num_members for group in self.assignable_groups],
+                                    dtype=np.int16)
+        self.individual_preferences = np.array(
+            [individual.preferences for individual in individuals], dtype=np.int16
+        ).reshape(len(individuals), num_options)
+
+        # Store the normalized traits of all assignable individuals in a single matrix, of
+        # which the individuals keep a view of their own row.
+        self.trait_matrix = np.array(
+            [individual.normalized_traits for individual in individuals], dtype=float
+        ).reshape(len(individuals), self.num_traits)
+        for index, individual in enumerate(individuals):
+            individual.normalized_traits = self.trait_matrix[index]
+
+        self.normalized_trait_weights = (np.asarray(self.trait_weights, dtype=float) /
+                                         (sum(self.trait_weights) or 1.0))
+        self.trait_penalty_keys = ['Trait {} differences'.format(t+1)
+                                   for t in range(self.num_traits)]
+
+    def __getstate__(self):
+        """Drop the iterator (progress bar, callbacks) and fitness cache when sending the solver
+        to workers."""
+        state = self.__dict__.copy()
+        state['solution_iterator'] = None
+        state['fitness_cache'] = None
+        return state
+
     def set_progress_callback(self, handler):
         """Set up a handler for reporting intermediate progress."""
         self.solution_iterator.set_progress_callback(handler)
@@ -119,9 +214,16 @@ class SchedulingSolver():
                 print("Loaded {} groups".format(len(groups_from_file)))
 
     def parse_timeslots(self):
-        if self.timeslots:
-            return
-        self.timeslots = [self.num_timeslots] * self.num_days
+        if not self.timeslots:
+            self.timeslots = [self.num_timeslots] * self.num_days
+        self.num_options = sum(self.timeslots)
+
+        # The day, slot and name of each option, which are also needed before solving.
+        self.option_days = np.repeat(np.arange(len(self.timeslots)), self.timeslots)
+        self.option_slots = np.arange(self.num_options) - np.repeat(
+            np.cumsum(self.timeslots) - self.timeslots, self.timeslots)
+        self.timeslot_names = ['Day {} Slot {}'.format(day, slot)
+                               for day, slot in zip(self.option_days, self.option_slots)]
 
     def load_scheduling_parameters(self, args):
         """Load scheduling parameters from command line, config file and defaults.
@@ -147,6 +249,11 @@ class SchedulingSolver():
             'seats_per_boat': 4,
             'min_available': 5,
             'population': 400,
+            'processes': 1,
+            'seed': None,
+            'islands': 1,
+            'migration_interval': 20,
+            'migrants': 3,
             'profile': 'default 400',
             'timeslots': None,
             'generated_group_prefix': 'Generated group'
@@ -154,8 +261,7 @@ class SchedulingSolver():
 
         # Parse config file. These override default values.
         if args.config:
-            with open(args.config) as infile:
-                config = yaml.safe_load(infile)
+            config = load_config(args.config)
             for key, value in config.items():
                 if key not in parameters:
                     print("Unknown config parameter: {}".format(key))
@@ -171,6 +277,14 @@ class SchedulingSolver():
         for key, value in parameters.items():
             setattr(self, key, value)
 
+        # Every island needs at least one individual, so there are at most as many as the
+        # population.
+        for key in ('islands', 'migration_interval', 'migrants'):
+            if getattr(self, key) < 1:
+                raise ValueError('Invalid number of {}: {}'.format(key.replace('_', ' '),
+                                                                   getattr(self, key)))
+        self.islands = min(self.islands, self.population)
+
     def generate_individual(self, offset=0):
         """Generate a single individual.
 
@@ -181,7 +295,8 @@ class SchedulingSolver():
             SchedulingIndividual
         """
         individual = SchedulingIndividual('Individual {}'.format(offset))
-        individual.randomize_preferences(sum(self.timeslots), self.availability_likelihood)
+        individual.randomize_preferences(self.num_options, self.availability_likelihood,
+                                         self.random_state)
         return individual
 
     def generate_group(self, group_size, group_offset, individual_offset):
@@ -193,10 +308,13 @@ class SchedulingSolver():
         Returns:
             SchedulingGroup
         """
-        individuals = [self.generate_individual(i) for i in range(individual_offset,
-                                                                  individual_offset + group_size)]
+        individuals = [SchedulingIndividual('Individual {}'.format(i))
+                       for i in range(individual_offset, individual_offset + group_size)]
         group = SchedulingGroup('Group {}'.format(group_offset), individuals,
-                                num_options=sum(self.timeslots))
+                                num_options=self.num_options)
+
+        # Draw the preferences of all members at once.
+        group.randomize_preferences(self.availability_likelihood, self.random_state)
         return group
 
     def save_generated_to_file(self, filename):
@@ -210,13 +328,13 @@ class SchedulingSolver():
             writer.writerow(['Name', 'Group'] + self.list_of_timeslots())
 
             # Write groups
-            for i, group in enumerate(self.assignable_groups):
-                for individual in group.members:
-                    writer.writerow([individual.name, i] + individual.preferences)
+            writer.writerows([individual.name, i] + individual.preferences.tolist()
+                             for i, group in enumerate(self.assignable_groups)
+                             for individual in group.members)
 
             # Write individuals
-            for individual in self.assignable_individuals[0]:
-                writer.writerow([individual.name, ''] + individual.preferences)
+            writer.writerows([individual.name, ''] + individual.preferences.tolist()
+                             for individual in self.assignable_individuals[0])
 
     def generate_groups(self):
         """Generate the groups based on the program parameters"""
@@ -227,7 +345,7 @@ class SchedulingSolver():
             offset = 0
 
             for j in range(self.num_to_generate):
-                group_size = random.choice(group_sizes)
+                group_size = int(self.random_state.choice(group_sizes))
                 self.assignable_groups.append(self.generate_group(group_size, j, offset))
                 offset += group_size
 
@@ -241,23 +359,23 @@ class SchedulingSolver():
             self.save_generated_to_file(self.groups_save_file)
 
     def generate_schedule_from_solution(self, solution, all_groups):
-        """Given a solution, create a [day -> slot -> groups] schedule.
+        """Given a solution, create a schedule of nested lists indexed by day and slot.
 
         Args:
             solution: the solution to create the schedule for
         """
-        days = {}
-        for day, timeslots in enumerate(self.timeslots):
-            days[day] = {}
-            for slot in range(timeslots):
-                days[day][slot] = []
+        days = [[[] for _ in range(timeslots)] for timeslots in self.timeslots]
 
-        for i in range(self.courses_per_team * self.total_groups):
-            assigned_option = solution[-1][i]
-            assigned_entity = all_groups[i // self.courses_per_team]
-            assigned_day, assigned_timeslot = self.timeslot_offset_to_pair(assigned_option)
+        # Sort the assigned courses by option, keeping them in order within each option.
+        schedule = np.asarray(solution[-1][:self.courses_per_team * self.total_groups])
+        entities = (np.argsort(schedule, kind='stable') // self.courses_per_team).tolist()
+        counts = np.bincount(schedule, minlength=len(self.option_days))
+        ends = np.cumsum(counts)
 
-            days[assigned_day][assigned_timeslot].append(assigned_entity)
+        for option in np.flatnonzero(counts).tolist():
+            day, slot = self.timeslot_offset_to_pair(option)
+            days[day][slot] = [all_groups[entity]
+                               for entity in entities[ends[option] - counts[option]:ends[option]]]
 
         return days
 
@@ -272,9 +390,7 @@ class SchedulingSolver():
 
     def list_of_timeslots(self):
         """Returns a list of strings for each day and timeslot."""
-        return ['Day {} Slot {}'.format(day, slot)
-                for day, timeslots in enumerate(self.timeslots)
-                for slot in range(timeslots)]
+        return list(self.timeslot_names)
 
     def timeslot_offset_to_pair(self, offset):
         """Returns the day and slot given a timeslot offset.
@@ -284,11 +400,7 @@ class SchedulingSolver():
         Args:
             offset: solution offset of timeslot
         """
-        for day, timeslots in enumerate(self.timeslots):
-            offset -= timeslots
-            if offset < 0:
-                break
-        return day, offset + timeslots
+        return int(self.option_days[offset]), int(self.option_slots[offset])
 
     def maximum_score(self, split=False):
         """Get the maximum possible score.
@@ -309,12 +421,7 @@ class SchedulingSolver():
             return assignment_score + solution_score
 
     def setup_deap(self):
-        """Initialize the deap module."""
-
-        creator.create("FitnessMax", base.Fitness, weights=(1.0,))
-
-        # An individual is a permutation of numbers
-        creator.create("Individual", list, fitness=creator.FitnessMax)
+        """Create a toolbox with the functions of this solver."""
         toolbox = base.Toolbox()
 
         toolbox.register("permutation", generate_permutation, solver=self)
@@ -322,18 +429,88 @@ class SchedulingSolver():
                          creator.Individual, toolbox.permutation)
         toolbox.register("population", tools.initRepeat, list, toolbox.individual)
 
-        # Register evaluation function
+        # Register evaluation functions
         toolbox.register("evaluate", evaluate_permutation, solver=self)
+        toolbox.register("evaluate_population", evaluate_population, solver=self)
 
         # Reproduction and mutation
-        toolbox.register("mate", lambda a, b: (a, b))
+        toolbox.register("clone", clone_permutation)
         toolbox.register("mutate", mutate_permutation, solver=self)
 
         # Selection method
-        toolbox.register("select", tools.selTournament, tournsize=3)
+        toolbox.register("select", select_tournament, tournsize=3, random_state=self.random_state)
         return toolbox
 
 
+    def evaluate_offspring(self, offspring, evaluate):
+        """Calculate the fitness of offspring, reusing the scores of solutions seen before.
+
+        Mutated offspring often recreate solutions that were scored before, so scores are cached
+        per solution and weights. The least recently used scores are evicted beyond ten times the
+        population.
+
+        Args:
+            offspring: the solutions to score
+            evaluate: function that scores a list of solutions, like evaluate_population
+
+        Returns:
+            list with a tuple of one SolutionScore object per solution
+        """
+        weights = tuple(self.current_step.parameters['weights'])
+        keys = [(weights, tuple(part.tobytes() for part in individual))
+                for individual in offspring]
+
+        missing = [i for i, key in enumerate(keys) if key not in self.fitness_cache]
+        if missing:
+            for i, fit in zip(missing, evaluate([offspring[i] for i in missing])):
+                self.fitness_cache[keys[i]] = fit
+
+        fits = []
+        for key in keys:
+            self.fitness_cache.move_to_end(key)
+            fits.append(self.fitness_cache[key])
+
+        while len(self.fitness_cache) > 10 * self.population:
+            self.fitness_cache.popitem(last=False)
+        return fits
+
+    def evaluate_in_pool(self, pool, solutions):
+        """Score solutions in worker processes, one chunk of solutions per worker.
+
+        Args:
+            pool: multiprocessing pool initialized with _initialize_worker
+            solutions: the solutions to score
+
+        Returns:
+            list with a tuple of one SolutionScore object per solution
+        """
+        size = -(-len(solutions) // self.processes)
+        chunks = [(self.current_step, solutions[i:i + size])
+                  for i in range(0, len(solutions), size)]
+        return list(itertools.chain.from_iterable(pool.map(_evaluate_chunk, chunks)))
+
+    def migrate(self, islands, toolbox):
+        """Move copies of the best individuals of each island to the next island in a ring.
+
+        The migrants replace the worst individuals of the island they move to.
+
+        Args:
+            islands: list of populations
+            toolbox: the deap toolbox
+
+        Returns:
+            list of populations after migration
+        """
+        migrants = [[toolbox.clone(ind) for ind in
+                     tools.selBest(island, k=min(self.migrants, len(island) - 1))]
+                    for island in islands]
+
+        result = []
+        for island, arriving in zip(islands, migrants[-1:] + migrants[:-1]):
+            staying = tools.selBest(island, k=len(island) - len(arriving))
+            result.append(staying + arriving)
+        return result
+
     def solve(self):
         """Setup the deap module and find the best permutation."""
 
@@ -345,42 +522,82 @@ class SchedulingSolver():
 
         toolbox = self.setup_deap()
 
-        # Create population
-        population = toolbox.population(n=self.population)
-
-        # Perform evoluationary algorithm
-        result = None
-        self.solution_iterator.initialize_progressbar()
-
-        maximum_fit = -10*6
-        maximum_score_object = None
-
-        for step in self.solution_iterator:
-            self.current_step = step
-            self.solution_iterator.update_progressbar(100 * maximum_fit / maximum_score)
-            offspring = algorithms.varAnd(population, toolbox, cxpb=0.5, mutpb=0.1)
-
-            fits = toolbox.map(toolbox.evaluate, offspring)
-            for fit, ind in zip(fits, offspring):
-                score = fit[0].score()
-                # Update maximum fit
-                if score > maximum_fit:
-                    maximum_fit = score
-                    maximum_score_object = fit[0]
-
-                if int(score) == maximum_score:
-                    result = ind
+        # Evaluate offspring in worker processes if requested, on all cores for zero processes.
+        if self.processes == 0:
+            self.processes = multiprocessing.cpu_count()
+        pool = None
+        evaluate = toolbox.evaluate_population
+        if self.processes and self.processes > 1:
+            pool = multiprocessing.Pool(self.processes, initializer=_initialize_worker,
+                                        initargs=(self,))
+            evaluate = partial(self.evaluate_in_pool, pool)
+        self.fitness_cache = OrderedDict()
+
+        # Close the worker processes even when solving fails.
+        try:
+            # Create population, divided over islands that evolve separately.
+            population = toolbox.population(n=self.population)
+            islands = [population[i::self.islands] for i in range(self.islands)]
+
+            # Perform evoluationary algorithm
+            result = None
+            self.solution_iterator.initialize_progressbar()
+
+            maximum_fit = -10*6
+            maximum_score_object = None
+
+            for generation, step in enumerate(self.solution_iterator):
+
+                # Fitness values depend on the weights, so rescore everything when they change.
+                if self.current_step and \
+                        step.parameters['weights'] != self.current_step.parameters['weights']:
+                    for ind in itertools.chain.from_iterable(islands):
+                        del ind.fitness.values
+
+                self.current_step = step
+                self.solution_iterator.update_progressbar(100 * maximum_fit / maximum_score)
+
+                # Mating would leave both parents unchanged, so offspring are only mutated.
+                offspring = [vary_population(island, toolbox, 0.1, self.random_state)
+                             for island in islands]
+
+                # Only score the offspring that were changed by mutation.
+                invalid = [ind for ind in itertools.chain.from_iterable(offspring)
+                           if not ind.fitness.valid]
+                fits = self.evaluate_offspring(invalid, evaluate)
+                scores = [fit[0].score() for fit in fits]
+                for score, ind in zip(scores, invalid):
+                    ind.fitness.values = score,
+
+                # Only the best offspring can improve the maximum fit or reach the maximum score.
+                if scores:
+                    best = max(range(len(scores)), key=scores.__getitem__)
+                    score = scores[best]
+                    if score > maximum_fit:
+                        maximum_fit = score
+                        maximum_score_object = fits[best][0]
+
+                    # Truncating only matches scores of at least the maximum, so compare those
+                    # first.
+                    if score >= maximum_score and int(score) == maximum_score:
+                        result = invalid[best]
+
+                islands = [toolbox.select(island_offspring, k=len(island))
+                           for island_offspring, island in zip(offspring, islands)]
+                if maximum_score_object:
+                    self.solution_iterator.register_fitness(maximum_score_object)
+
+                if result:
                     break
-                ind.fitness.values = score,
-
-            population = toolbox.select(offspring, k=len(population))
-            if maximum_score_object:
-                self.solution_iterator.register_fitness(maximum_score_object)
 
-            if result:
-                break
-        else:
-            result = tools.selBest(population, k=1)[0]
+                if len(islands) > 1 and (generation + 1) % self.migration_interval == 0:
+                    islands = self.migrate(islands, toolbox)
+            else:
+                result = tools.selBest(list(itertools.chain.from_iterable(islands)), k=1)[0]
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
 
         self.solution_iterator.update_progressbar(100 * maximum_fit / maximum_score, final=True)
 
@@ -418,20 +635,18 @@ class SchedulingSolver():
                             ['Info {}'.format(i+1) for i in range(self.num_info)] +
                             ['Trait {}'.format(i+1) for i in range(self.num_traits)] +
                             self.list_of_timeslots())
-            for group in self.solution_groups:
-                for member in group.members:
-                    writer.writerow([member.name, group.name] + member.info + member.traits +
-                                    member.availability())
+            writer.writerows([member.name, group.name] + member.info + member.traits +
+                             member.availability().tolist()
+                             for group in self.solution_groups for member in group.members)
 
 
         schedule_file = "{}_schedule.csv".format(self.output_prefix)
         with open(schedule_file, 'w') as outfile:
             writer = csv.writer(outfile)
             writer.writerow(['Day'] + list(range(1, max(self.timeslots) + 1)))
-            for day, timeslots in enumerate(self.timeslots):
-                slots = self.solution_schedule[day]
-                writer.writerow([day + 1] + [', '.join([str(x) for x in slots[slot]])
-                                             for slot in range(timeslots)])
+            writer.writerows([day + 1] + [', '.join(map(str, self.solution_schedule[day][slot]))
+                                          for slot in range(timeslots)]
+                             for day, timeslots in enumerate(self.timeslots))
 
         config_file = "{}_config.yaml".format(self.output_prefix)
         with open(config_file, 'w') as outfile:
@@ -451,13 +666,13 @@ class SchedulingSolver():
             yaml.dump(config, outfile)
 
     def _report_initialization(self):
-        total_options_available = self.num_boats * sum(self.timeslots)
-        total_individuals_to_assign = sum([len(group) for group in self.assignable_individuals])
+        total_options_available = self.num_boats * self.num_options
+        total_individuals_to_assign = sum(len(group) for group in self.assignable_individuals)
         total_to_assign = self.total_groups * self.courses_per_team
 
         # Print info about current ratio.
         print("Total options available: {} ({} timeslots x {} boats)".format(
-            total_options_available, sum(self.timeslots), self.num_boats
+            total_options_available, self.num_options, self.num_boats
         ))
         if self.assignable_individuals:
             print("")
@@ -483,12 +698,9 @@ class SchedulingSolver():
         Args:
             table: dict with keys 'data' and 'headers'
         """
-        data = table['data']
-        rows = [
-            [data[k][j] if len(data[k]) > j else '' for k in range(len(data))]
-            for j in range(max([len(data[k]) for k in range(len(data))]))
-        ]
-        print(tabulate(rows, headers=table['headers']))
+        # Transpose the columns into rows, padding the shorter columns.
+        rows = itertools.zip_longest(*table['data'], fillvalue='')
+        print(tabulate(list(rows), headers=table['headers']))
         print("")
 
     def _groups_to_tables(self):
@@ -501,9 +713,8 @@ class SchedulingSolver():
 
             tables[-1]['headers'].append(group.name)
             if self.num_traits:
-                tables[-1]['data'].append(["{} ({})".format(
-                    member.name, ', '.join([str(x) for x in member.traits])
-                ) for member in group.members])
+                tables[-1]['data'].append(["{} ({})".format(member.name, member.traits_label)
+                                           for member in group.members])
             else:
                 tables[-1]['data'].append(["{}".format(member.name)
                                            for member in group.members])
@@ -524,7 +735,7 @@ class SchedulingSolver():
         """Print info about the scheduling solution."""
         print("Number of teams: {}".format(self.total_groups))
         print("Available boats per option: {}".format(self.num_boats))
-        print("Available options: {}".format(sum(self.timeslots)))
+        print("Available options: {}".format(self.num_options))
         score = evaluate_permutation(self.solution, self)[0]
         assignment_max, scheduling_max = self.maximum_score(True)
         score.report([assignment_max, scheduling_max])
@@ -0,0 +1,240 @@
+from collections import Counter
+import contextlib
+import io
+import os
+import unittest
+
+import numpy as np
+from deap import creator
+
+from esme.algorithms import evaluate_permutation, evaluate_population, finalize_solution, \
+    generated_groups, select_tournament, shuffle_indexes, vary_population
+from esme.common import parse_args, group_members_from_solution, teams_from_solution, \
+    SolutionScore
+from esme.entities import SchedulingGroup, SchedulingIndividual
+from esme.iterator import SolverMethod, SolverStep
+from esme.solver import SchedulingSolver
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+CONFIGS = [
+    ['-c', os.path.join(EXAMPLES, 'config-simple.yaml')],
+    ['-c', os.path.join(EXAMPLES, 'config-assignment.yaml')],
+    ['-c', os.path.join(EXAMPLES, 'config-large.yaml'),
+     '-i', os.path.join(EXAMPLES, 'availability-large-male.csv'),
+     os.path.join(EXAMPLES, 'availability-large-female.csv')],
+]
+
+WEIGHTS = [[1.0, 1.0], [1.0, 0.0], [0.0, 1.0], [0.5, 2.0]]
+
+
+def create_solver(arguments):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return SchedulingSolver(parse_args(arguments + ['--seed', '1']))
+
+
+def reference_score(solution, solver):
+    """Score a solution group by group, using the measurements of the entities."""
+    clustering_weight, scheduling_weight = solver.current_step.parameters['weights']
+    score = SolutionScore(clustering_weight, scheduling_weight)
+
+    # Individual j of collection i is assigned to group solution[i][j], if the part is long enough.
+    members = {}
+    for part, category in zip(solution, solver.assignable_individuals):
+        for group, individual in zip(part, category):
+            members.setdefault(int(group), []).append(individual)
+    generated = [SchedulingGroup('Group {}'.format(group), group_members)
+                 for group, group_members in members.items()]
+
+    for group in generated:
+        if len(group.members) < solver.min_members_per_group:
+            continue
+        score.assignment['score'] += 1.0
+        if clustering_weight and solver.num_traits:
+            for t in range(solver.num_traits):
+                score.assignment['penalty'].setdefault('Trait {} differences'.format(t+1), 0.0)
+                score.assignment['penalty']['Trait {} differences'.format(t+1)] += (
+                    solver.trait_weights[t] * group.trait_cumulative_penalty(t, normalize=True) /
+                    sum(solver.trait_weights))
+
+    if scheduling_weight:
+        groups = solver.assignable_groups + generated
+        schedule = [int(option) for option in solution[-1]]
+        for g in range(solver.courses_per_team * len(groups)):
+            group = groups[g // solver.courses_per_team]
+            if group.availability(schedule[g]) >= solver.min_available:
+                score.scheduling['score'] += group.availability(schedule[g]) / group.num_members
+            else:
+                score.scheduling['penalty']['Not enough members'] += 1.0
+
+        for g in range(len(groups)):
+            days = Counter(solver.timeslot_offset_to_pair(option)[0] for option in
+                           schedule[g * solver.courses_per_team:(g+1) * solver.courses_per_team])
+            if days.most_common(1)[0][1] > 1:
+                score.scheduling['penalty']['Same day schedule'] += 2.0
+
+    return score
+
+
+class TestEvaluation(unittest.TestCase):
+
+    def assertScoresEqual(self, score, expected):
+        self.assertAlmostEqual(score.score(), expected.score())
+        self.assertAlmostEqual(score.assignment_score(), expected.assignment_score())
+        self.assertAlmostEqual(score.scheduling_score(), expected.scheduling_score())
+        for part in ('assignment', 'scheduling'):
+            penalties = getattr(score, part)['penalty']
+            for key, penalty in getattr(expected, part)['penalty'].items():
+                self.assertAlmostEqual(penalties[key], penalty, msg=key)
+
+    def test_evaluate(self):
+        for arguments in CONFIGS:
+            solver = create_solver(arguments)
+            toolbox = solver.setup_deap()
+            population = toolbox.population(n=20)
+
+            for weights in WEIGHTS:
+                solver.current_step = SolverStep(0, SolverMethod.BOTH, weights=weights, inpdb=0.1)
+                for individual in population:
+                    toolbox.mutate(individual)
+
+                scores = evaluate_population(population, solver)
+                for individual, (score,) in zip(population, scores):
+                    expected = reference_score(individual, solver)
+                    self.assertScoresEqual(score, expected)
+                    self.assertScoresEqual(evaluate_permutation(individual, solver)[0], expected)
+
+    def test_evaluate_short_part(self):
+        # The first of two collections has a part that leaves its last individuals unassigned.
+        solver = create_solver(CONFIGS[2])
+        toolbox = solver.setup_deap()
+        population = toolbox.population(n=20)
+        for individual in population:
+            individual[0] = individual[0][:len(solver.assignable_individuals[0]) - 5]
+
+        for weights in WEIGHTS:
+            solver.current_step = SolverStep(0, SolverMethod.BOTH, weights=weights, inpdb=0.1)
+            for individual in population:
+                toolbox.mutate(individual)
+
+            scores = evaluate_population(population, solver)
+            for individual, (score,) in zip(population, scores):
+                expected = reference_score(individual, solver)
+                self.assertScoresEqual(score, expected)
+                self.assertScoresEqual(evaluate_permutation(individual, solver)[0], expected)
+
+    def test_evaluate_empty_population(self):
+        solver = create_solver(CONFIGS[0])
+        solver.current_step = SolverStep(0, SolverMethod.BOTH, weights=[1.0, 1.0], inpdb=0.1)
+        self.assertEqual(evaluate_population([], solver), [])
+
+    def test_finalize_solution(self):
+        for arguments in CONFIGS:
+            solver = create_solver(arguments)
+            solver.current_step = SolverStep(0, SolverMethod.BOTH, weights=[1.0, 1.0], inpdb=0.1)
+            solution = solver.setup_deap().individual()
+            final = finalize_solution(solution, solver)
+
+            score = evaluate_permutation(final, solver)[0].scheduling_score()
+            self.assertGreaterEqual(score + 1e-9,
+                                    evaluate_permutation(solution, solver)[0].scheduling_score())
+            self.assertEqual([part.tolist() for part in final[:-1]],
+                             [part.tolist() for part in solution[:-1]])
+            self.assertEqual(sorted(final[-1].tolist()), sorted(solution[-1].tolist()))
+
+            # No single swap of two courses improves the final schedule.
+            num_groups = len(solver.assignable_groups) + len(generated_groups(final, solver).counts)
+            num_slots = solver.courses_per_team * num_groups
+            for i in range(num_slots):
+                for j in range(i + 1, len(final[-1])):
+                    schedule = final[-1].copy()
+                    schedule[i], schedule[j] = schedule[j], schedule[i]
+                    swapped = evaluate_permutation(final[:-1] + [schedule], solver)[0]
+                    self.assertLessEqual(swapped.scheduling_score(), score + 1e-9)
+
+    def test_group_members_from_solution(self):
+        assignable_individuals = [[None] * 5, [None] * 4]
+        solution = [[3, 1, 3, 0, 1, 7, 7], [2, 4, 4, 2, 5], [0, 1]]
+        labels, members, counts = group_members_from_solution(solution, assignable_individuals)
+
+        self.assertEqual(labels.tolist(), [3, 1, 0, 2, 4])
+        self.assertEqual(counts.tolist(), [2, 2, 1, 2, 2])
+        self.assertEqual(members.tolist(), [0, 2, 1, 4, 3, 5, 8, 6, 7])
+
+    def test_group_members_from_short_part(self):
+        # Individuals beyond the end of a part are not assigned, and the next collection keeps
+        # its own indices.
+        assignable_individuals = [[None] * 5, [None] * 4]
+        solution = [[3, 1, 3], [2, 4, 4, 2], [0, 1]]
+        labels, members, counts = group_members_from_solution(solution, assignable_individuals)
+
+        self.assertEqual(labels.tolist(), [3, 1, 2, 4])
+        self.assertEqual(counts.tolist(), [2, 1, 2, 2])
+        self.assertEqual(members.tolist(), [0, 2, 1, 5, 8, 6, 7])
+
+    def test_teams_from_short_part(self):
+        assignable_individuals = [
+            [SchedulingIndividual('a{}'.format(i), np.ones(3, dtype=np.int8)) for i in range(5)],
+            [SchedulingIndividual('b{}'.format(i), np.ones(3, dtype=np.int8)) for i in range(4)]
+        ]
+        solution = [[3, 1, 3], [2, 4, 4, 2], [0, 1]]
+        teams = teams_from_solution(solution, assignable_individuals)
+
+        self.assertEqual({team.name: [member.name for member in team.members] for team in teams},
+                         {'Generated group 4': ['a0', 'a2'], 'Generated group 2': ['a1'],
+                          'Generated group 3': ['b0', 'b3'], 'Generated group 5': ['b1', 'b2']})
+
+
+class TestVariation(unittest.TestCase):
+
+    def create_population(self, scores):
+        population = []
+        for score in scores:
+            individual = creator.Individual([np.arange(10)])
+            individual.fitness.values = score,
+            population.append(individual)
+        return population
+
+    def test_select_tournament(self):
+        population = self.create_population([3.0, 1.0, 4.0, 1.5, 5.0, 9.0, 2.0])
+        random_state = np.random.RandomState(1)
+
+        # Every tournament that holds the whole population is won by its best individual.
+        selected = select_tournament(population, 50, len(population) * 20, random_state)
+        self.assertEqual(len(selected), 50)
+        self.assertTrue(all(ind is population[5] for ind in selected))
+
+        # The winner of a tournament of one is the single aspirant, so the worst may be drawn.
+        selected = select_tournament(population, 200, 1, random_state)
+        self.assertTrue(any(ind is population[1] for ind in selected))
+
+    def test_shuffle_indexes(self):
+        random_state = np.random.RandomState(1)
+        sequence = np.arange(50)
+        shuffled, = shuffle_indexes(sequence.copy(), 0.0, random_state)
+        self.assertEqual(shuffled.tolist(), sequence.tolist())
+
+        shuffled, = shuffle_indexes(sequence.copy(), 0.5, random_state)
+        self.assertNotEqual(shuffled.tolist(), sequence.tolist())
+        self.assertEqual(sorted(shuffled.tolist()), sequence.tolist())
+
+    def test_vary_population(self):
+        solver = create_solver(CONFIGS[1])
+        solver.current_step = SolverStep(0, SolverMethod.BOTH, weights=[1.0, 1.0], inpdb=0.5)
+        toolbox = solver.setup_deap()
+        population = self.create_population([1.0, 2.0, 3.0])
+
+        offspring = vary_population(population, toolbox, 0.0, solver.random_state)
+        self.assertTrue(all(child is parent for child, parent in zip(offspring, population)))
+
+        offspring = vary_population(population, toolbox, 1.0, solver.random_state)
+        for child, parent in zip(offspring, population):
+            self.assertIsNot(child, parent)
+            self.assertFalse(child.fitness.valid)
+            self.assertTrue(parent.fitness.valid)
+            self.assertEqual(parent[0].tolist(), list(range(10)))
+            self.assertEqual(sorted(child[0].tolist()), list(range(10)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import contextlib
+import io
+import os
+import unittest
+
+import numpy as np
+from deap import creator
+
+from esme.common import parse_args
+from esme.solver import SchedulingSolver
+
+CONFIG = os.path.join(os.path.dirname(__file__), '..', 'examples', 'config-assignment.yaml')
+
+
+def create_solver(*arguments):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return SchedulingSolver(parse_args(['-c', CONFIG, '--seed', '1'] + list(arguments)))
+
+
+class TestIslands(unittest.TestCase):
+
+    def test_invalid_islands(self):
+        with self.assertRaises(ValueError):
+            create_solver('--islands', '0')
+
+    def test_islands_limited_by_population(self):
+        solver = create_solver('--islands', '8', '-y', '5')
+        self.assertEqual(solver.islands, 5)
+
+    def test_migrate(self):
+        solver = create_solver('--islands', '3')
+        solver.migrants = 2
+        toolbox = solver.setup_deap()
+
+        islands = []
+        for island in range(3):
+            population = []
+            for score in range(5):
+                individual = creator.Individual([np.array([island, score])])
+                individual.fitness.values = 10 * island + score,
+                population.append(individual)
+            islands.append(population)
+
+        migrated = solver.migrate(islands, toolbox)
+
+        for island in range(3):
+            scores = sorted(ind.fitness.values[0] for ind in migrated[island])
+            previous = 10 * ((island - 1) % 3)
+            own = 10 * island
+            expected = sorted([previous + 3, previous + 4, own + 2, own + 3, own + 4])
+            self.assertEqual(scores, expected)
+
+        # Migrants are copies, so changing them leaves the island they came from unchanged.
+        arrived = [ind for ind in migrated[1] if ind[0][0] == 0]
+        self.assertEqual(len(arrived), 2)
+        for individual in arrived:
+            self.assertFalse(any(individual is ind for ind in islands[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()